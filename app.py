@@ -1,15 +1,54 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
-import subprocess
-import json
+from fastapi import FastAPI, Request
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import asyncio
+import msgspec
+import orjson
+
+from solver_horario import nucleos_disponibles, resolver_horario_con_slots
+
+SOLVER_WORKERS = 4
+# Los núcleos se reparten entre los workers del pool para no sobresuscribir la CPU
+SOLVER_THREADS = max(1, nucleos_disponibles() // SOLVER_WORKERS)
+SOLVER_TIMEOUT = 65
+HINT_CACHE_SIZE = 256
+
+class ORJSONResponse(JSONResponse):
+    def render(self, content):
+        return orjson.dumps(content)
 
 app = FastAPI(
     title="Horario Solver API",
     docs_url="/docs",
     redoc_url="/redoc",
-    openapi_url="/openapi.json"
+    openapi_url="/openapi.json",
+    default_response_class=ORJSONResponse
 )
 
+# Las respuestas grandes del solver son JSON muy repetitivo y comprimen bien
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
+def _preload_ortools():
+    # Importa ortools una sola vez por proceso worker
+    from ortools.sat.python import cp_model  # noqa: F401
+
+def _crear_pool():
+    return ProcessPoolExecutor(max_workers=SOLVER_WORKERS, initializer=_preload_ortools)
+
+@app.on_event("startup")
+async def startup():
+    app.state.pool = _crear_pool()
+    # Slots de la última solución por huella de la entrada, para sugerirlos como hint (LRU)
+    app.state.last_solution_by_fingerprint = OrderedDict()
+
+@app.on_event("shutdown")
+async def shutdown():
+    # Sin esperar: un solve en curso puede tardar hasta el límite del solver
+    app.state.pool.shutdown(wait=False, cancel_futures=True)
+
 @app.get("/")
 async def root():
     return {"status": "ok"}
@@ -18,7 +57,7 @@ async def root():
 async def ping():
     return "pong"
 
-class SolverInput(BaseModel):
+class SolverInput(msgspec.Struct):
     unidades: list
     periodos_validos: list
     grados: list
@@ -26,30 +65,60 @@ class SolverInput(BaseModel):
     modo_multidia: bool = False
     dias: list = []
     periodos_por_dia: int = 0
+    hint: list = []
+
+def _huella(data):
+    return hash(msgspec.json.encode([data.unidades, data.grados, data.modo_multidia]))
+
+# msgspec decodifica y valida el body en una sola pasada; el esquema se publica en OpenAPI a mano
+_, _esquemas = msgspec.json.schema_components([SolverInput])
 
-@app.post("/solve")
-async def solve(data: SolverInput):
+@app.post("/solve", openapi_extra={
+    "requestBody": {
+        "content": {"application/json": {"schema": _esquemas["SolverInput"]}},
+        "required": True
+    }
+})
+async def solve(request: Request):
     try:
-        proc = subprocess.Popen(
-            ["python3", "solver_horario.py"],
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
+        data = msgspec.json.decode(await request.body(), type=SolverInput)
+    except msgspec.DecodeError as e:
+        return ORJSONResponse({"exito": False, "mensaje": str(e)}, status_code=422)
 
-        input_json = json.dumps(data.dict(), ensure_ascii=False)
+    try:
+        datos = msgspec.structs.asdict(data)
+
+        # Se cachean los slots crudos del solver: el hint no depende de los valores del usuario
+        soluciones = app.state.last_solution_by_fingerprint
+        huella = _huella(data)
+        if not data.hint and huella in soluciones:
+            soluciones.move_to_end(huella)
+            datos['hint_slots'] = soluciones[huella]
 
-        stdout, stderr = proc.communicate(input=input_json, timeout=60)
+        # Procesos persistentes: aislamiento sin pagar arranque de Python por request;
+        # max_time_in_seconds del solver es el limite real, esto es un respaldo
+        pool = app.state.pool
+        fut = pool.submit(resolver_horario_con_slots, datos, SOLVER_THREADS)
+        resultado, slots = await asyncio.wait_for(asyncio.wrap_future(fut), timeout=SOLVER_TIMEOUT)
 
-        if stderr and stderr.strip():
-            return {"exito": False, "mensaje": stderr}
+        if slots:
+            soluciones[huella] = slots
+            soluciones.move_to_end(huella)
+            if len(soluciones) > HINT_CACHE_SIZE:
+                soluciones.popitem(last=False)
 
-        return json.loads(stdout)
+        return resultado
 
-    except subprocess.TimeoutExpired:
-        proc.kill()
+    except asyncio.TimeoutError:
         return {"exito": False, "mensaje": "Tiempo de ejecución excedido (timeout)"}
 
+    except BrokenProcessPool:
+        # Un worker murio (p. ej. por memoria); se recrea el pool para los siguientes requests.
+        # Solo el primer request que falla lo reemplaza: los demás ya ven el pool nuevo
+        if app.state.pool is pool:
+            app.state.pool = _crear_pool()
+            pool.shutdown(wait=False, cancel_futures=True)
+        return {"exito": False, "mensaje": "El proceso del solver terminó inesperadamente"}
+
     except Exception as e:
         return {"exito": False, "mensaje": str(e)}
@@ -12,299 +12,267 @@ Recibe JSON con:
 - modo_multidia: true/false (para PLAN DIARIO)
 - dias: lista de días (solo si modo_multidia)
 - periodos_por_dia: número de periodos por día (solo si modo_multidia)
+- hint: asignaciones de una solución previa, mismo formato que la salida (opcional).
+  Se usa como punto de partida del solver; entradas null o desconocidas se ignoran
 
 Devuelve JSON con:
 - exito: true/false
-- asignaciones: {unidad_idx: periodo_idx} o {unidad_idx: {dia: X, periodo: Y}}
+- asignaciones: lista por posición de unidad: [periodo, ...] o [[dia, periodo], ...]
 - mensaje: descripción del resultado
 """
 
+import os
 import sys
-import json
+import orjson
+from collections import Counter, defaultdict
 from ortools.sat.python import cp_model
 
-def resolver_horario(datos):
+def nucleos_disponibles():
+    """Núcleos que puede usar este proceso (respeta la afinidad/cpuset del contenedor)"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def crear_solver(max_tiempo, num_hilos=None):
+    """CpSolver configurado para los modelos pequeños/medianos de la API"""
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = max_tiempo
+    solver.parameters.num_workers = num_hilos or nucleos_disponibles()
+    solver.parameters.cp_model_presolve = True
+    solver.parameters.linearization_level = 2
+    # Las unidades intercambiables (mismo docente y grados) generan simetrías
+    solver.parameters.symmetry_level = 2
+    solver.parameters.log_search_progress = False
+    return solver
+
+def resolver_horario(datos, num_hilos=None):
+    """num_hilos: hilos de CP-SAT; por defecto todos los núcleos disponibles"""
+    return resolver_horario_con_slots(datos, num_hilos)[0]
+
+def resolver_horario_con_slots(datos, num_hilos=None):
+    """Como resolver_horario, pero devuelve (resultado, slots): slots son los valores crudos
+    del solver por unidad (None si no hay solución), aptos para hint_slots de otro request"""
     unidades = datos['unidades']
     periodos_validos = datos['periodos_validos']
-    grados = datos['grados']
     bloques_equiv = datos.get('bloques_equiv', {})
     modo_multidia = datos.get('modo_multidia', False)
     dias = datos.get('dias', [])
     periodos_por_dia = datos.get('periodos_por_dia', len(periodos_validos))
+    hint = datos.get('hint', [])
+    # Interno (caché de la API): slots crudos de una solución previa, sin pasar por periodos/días
+    hint_slots = datos.get('hint_slots')
     
     num_unidades = len(unidades)
     num_periodos = len(periodos_validos)
     
     if num_unidades == 0:
-        return {'exito': True, 'asignaciones': {}, 'mensaje': 'No hay cursos para asignar'}
+        return {'exito': True, 'asignaciones': [], 'mensaje': 'No hay cursos para asignar'}, None
     
-    # Crear conjunto de pares que son del mismo bloque
-    mismo_bloque = set()
+    # Union-find sobre bloques_equiv: los cursos de un mismo bloque comparten
+    # una sola variable, cuya raíz es el menor índice de la clase
+    padre = list(range(num_unidades))
+    def buscar(i):
+        while padre[i] != i:
+            padre[i] = padre[padre[i]]
+            i = padre[i]
+        return i
     for bloque_id, indices in bloques_equiv.items():
-        for i in range(len(indices)):
-            for j in range(i + 1, len(indices)):
-                mismo_bloque.add((min(indices[i], indices[j]), max(indices[i], indices[j])))
+        for i in indices[1:]:
+            a, b = buscar(indices[0]), buscar(i)
+            if a != b:
+                padre[max(a, b)] = min(a, b)
+    raiz = [buscar(i) for i in range(num_unidades)]
     
-    model = cp_model.CpModel()
+    # Grados y docente de cada unidad, calculados una sola vez
+    grados_set = [frozenset(u['grados']) for u in unidades]
+    docente = [u['id_docente'] for u in unidades]
+    
+    # Agrupar unidades por docente y por grado en una sola pasada, para emitir
+    # restricciones solo dentro de cada grupo en lugar de revisar todos los pares
+    por_docente = defaultdict(set)
+    por_grado = defaultdict(list)
+    nombre_docente = {}
+    for i in range(num_unidades):
+        # Los cursos de un mismo bloque van juntos: cuentan una sola vez por docente
+        por_docente[docente[i]].add(raiz[i])
+        # La raíz de un bloque puede ser de otro docente: el nombre se toma de sus propias unidades
+        if docente[i] not in nombre_docente:
+            nombre_docente[docente[i]] = unidades[i].get('docente_nombre', f'Docente {docente[i]}')
+        for g in grados_set[i]:
+            por_grado[g].append(i)
+    por_docente = {doc: sorted(indices) for doc, indices in por_docente.items()}
+    
+    # Cada grupo de docente o de grado es un AllDifferent sobre las variables raíz.
+    # Grupos idénticos (p. ej. un docente que dicta todos los cursos de un grado)
+    # se publican una sola vez
+    grupos_distintos = set()
+    for indices in [*por_docente.values(), *por_grado.values()]:
+        if len(indices) > 1:
+            grupos_distintos.add(tuple(sorted(raiz[i] for i in indices)))
+    grupos_distintos = sorted(grupos_distintos)
+    
+    # Unidades intercambiables: mismo docente y mismos grados, fuera de bloques.
+    # Cualquier permutación entre ellas da un horario equivalente
+    tamano_clase = Counter(raiz)
+    por_firma = defaultdict(list)
+    for i in range(num_unidades):
+        if tamano_clase[i] == 1:
+            por_firma[(docente[i], grados_set[i])].append(i)
+    intercambiables = [indices for indices in por_firma.values() if len(indices) > 1]
     
     if modo_multidia:
-        # ============================================
-        # MODO MULTIDÍA (PLAN DIARIO - 5 días)
-        # ============================================
+        # MODO MULTIDÍA (PLAN DIARIO - 5 días): slot global = día * periodos_por_dia + periodo
         num_dias = len(dias)
         num_slots = num_dias * periodos_por_dia
-        
-        # Variables: para cada unidad, en qué slot global va (día * periodos_por_dia + periodo)
-        asignacion = {}
-        for i in range(num_unidades):
-            asignacion[i] = model.NewIntVar(0, num_slots - 1, f'unidad_{i}')
-        
-        # Funciones auxiliares para extraer día y periodo de un slot
-        def get_dia(slot):
-            return slot // periodos_por_dia
-        def get_periodo(slot):
-            return slot % periodos_por_dia
-        
-        # Restricción: Cursos del mismo bloque DEBEN ir en el mismo slot (mismo día y periodo)
-        for bloque_id, indices in bloques_equiv.items():
-            if len(indices) > 1:
-                for i in range(1, len(indices)):
-                    model.Add(asignacion[indices[0]] == asignacion[indices[i]])
-        
-        # Para restricciones de "mismo día", necesitamos variables adicionales
-        dia_var = {}
-        for i in range(num_unidades):
-            dia_var[i] = model.NewIntVar(0, num_dias - 1, f'dia_{i}')
-            # dia_var[i] = asignacion[i] // periodos_por_dia
-            model.AddDivisionEquality(dia_var[i], asignacion[i], periodos_por_dia)
-        
-        periodo_var = {}
-        for i in range(num_unidades):
-            periodo_var[i] = model.NewIntVar(0, periodos_por_dia - 1, f'periodo_{i}')
-            # periodo_var[i] = asignacion[i] % periodos_por_dia
-            model.AddModuloEquality(periodo_var[i], asignacion[i], periodos_por_dia)
-        
-        # Restricción: Un docente no puede estar en dos lugares al mismo tiempo DEL MISMO DÍA
-        # EXCEPTO si son del mismo bloque de equivalencia
-        for i in range(num_unidades):
-            for j in range(i + 1, num_unidades):
-                par = (i, j)
-                if par in mismo_bloque:
-                    continue
-                
-                if unidades[i]['id_docente'] == unidades[j]['id_docente']:
-                    # Si están en el mismo día, deben estar en diferente periodo
-                    # Equivalente a: NOT (mismo_dia AND mismo_periodo)
-                    # = NOT mismo_dia OR NOT mismo_periodo
-                    # Usando variable auxiliar
-                    mismo_dia = model.NewBoolVar(f'mismo_dia_{i}_{j}')
-                    model.Add(dia_var[i] == dia_var[j]).OnlyEnforceIf(mismo_dia)
-                    model.Add(dia_var[i] != dia_var[j]).OnlyEnforceIf(mismo_dia.Not())
-                    
-                    # Si mismo_dia es True, entonces periodo debe ser diferente
-                    model.Add(periodo_var[i] != periodo_var[j]).OnlyEnforceIf(mismo_dia)
-        
-        # Restricción: Un grado no puede tener dos cursos al mismo tiempo (mismo día y periodo)
-        for i in range(num_unidades):
-            for j in range(i + 1, num_unidades):
-                grados_i = set(unidades[i]['grados'])
-                grados_j = set(unidades[j]['grados'])
-                if grados_i & grados_j:
-                    # Tienen grados en común, no pueden estar en el mismo slot
-                    model.Add(asignacion[i] != asignacion[j])
-        
-        # Resolver
-        solver = cp_model.CpSolver()
-        solver.parameters.max_time_in_seconds = 60.0
-        solver.parameters.num_search_workers = 4
-        
-        status = solver.Solve(model)
-        
-        if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
-            resultado = {}
-            for i in range(num_unidades):
-                slot = solver.Value(asignacion[i])
-                dia_idx = slot // periodos_por_dia
-                periodo_idx = slot % periodos_por_dia
-                resultado[i] = {
-                    'dia': dias[dia_idx] if dia_idx < len(dias) else f'DIA_{dia_idx}',
-                    'periodo': periodos_validos[periodo_idx] if periodo_idx < len(periodos_validos) else periodo_idx
-                }
-            
-            return {
-                'exito': True,
-                'asignaciones': resultado,
-                'mensaje': 'Solucion encontrada sin cruces',
-                'status': 'OPTIMAL' if status == cp_model.OPTIMAL else 'FEASIBLE',
-                'modo': 'multidia'
-            }
-        else:
-            mensaje = analizar_infactibilidad_multidia(unidades, periodos_por_dia, num_dias, grados, bloques_equiv, mismo_bloque)
-            return {
-                'exito': False,
-                'asignaciones': {},
-                'mensaje': mensaje,
-                'status': 'INFEASIBLE',
-                'modo': 'multidia'
-            }
-    
+        modo = 'multidia'
+        max_tiempo = 60.0
+        encabezado = f"No hay solucion sin cruces ({num_dias} dias x {periodos_por_dia} periodos = {num_slots} slots). Docentes:"
     else:
-        # ============================================
-        # MODO NORMAL (FIN_SEMANA - 1 día)
-        # ============================================
-        # Variables: para cada unidad, en qué periodo va
-        asignacion = {}
-        for i in range(num_unidades):
-            asignacion[i] = model.NewIntVar(0, num_periodos - 1, f'unidad_{i}')
-        
-        # Restricción: Cursos del mismo bloque DEBEN ir en el mismo periodo
-        for bloque_id, indices in bloques_equiv.items():
-            if len(indices) > 1:
-                for i in range(1, len(indices)):
-                    model.Add(asignacion[indices[0]] == asignacion[indices[i]])
-        
-        # Restricción: Un docente no puede estar en dos lugares al mismo tiempo
-        # EXCEPTO si son del mismo bloque de equivalencia
-        for i in range(num_unidades):
-            for j in range(i + 1, num_unidades):
-                par = (i, j)
-                if par in mismo_bloque:
-                    continue
-                
-                if unidades[i]['id_docente'] == unidades[j]['id_docente']:
-                    model.Add(asignacion[i] != asignacion[j])
-        
-        # Restricción: Un grado no puede tener dos cursos al mismo tiempo
-        for i in range(num_unidades):
-            for j in range(i + 1, num_unidades):
-                grados_i = set(unidades[i]['grados'])
-                grados_j = set(unidades[j]['grados'])
-                if grados_i & grados_j:
-                    model.Add(asignacion[i] != asignacion[j])
-        
-        # Resolver
-        solver = cp_model.CpSolver()
-        solver.parameters.max_time_in_seconds = 30.0
-        solver.parameters.num_search_workers = 4
-        
-        status = solver.Solve(model)
-        
-        if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
-            resultado = {}
-            for i in range(num_unidades):
-                periodo_idx_local = solver.Value(asignacion[i])
-                periodo_real = periodos_validos[periodo_idx_local]
-                resultado[i] = periodo_real
-            
-            return {
-                'exito': True,
-                'asignaciones': resultado,
-                'mensaje': 'Solucion encontrada sin cruces',
-                'status': 'OPTIMAL' if status == cp_model.OPTIMAL else 'FEASIBLE',
-                'modo': 'unidia'
-            }
+        # MODO NORMAL (FIN_SEMANA - 1 día): slot = índice en periodos_validos
+        num_slots = num_periodos
+        modo = 'unidia'
+        max_tiempo = 30.0
+        encabezado = "No hay solucion sin cruces. Docentes con exceso:"
+    
+    # Poda previa: un grupo (docente o grado) con más unidades que slots no tiene
+    # solución, así que no hace falta construir ni resolver el modelo
+    if num_slots <= 0 or any(len(grupo) > num_slots for grupo in grupos_distintos):
+        return {
+            'exito': False,
+            'asignaciones': [],
+            'mensaje': _analizar(nombre_docente, por_docente, num_slots, encabezado),
+            'status': 'INFEASIBLE',
+            'modo': modo
+        }, None
+    
+    # Dominio de cada unidad: la k-ésima de un grupo intercambiable ordenado tiene
+    # al menos k unidades antes y (tamaño - k - 1) después
+    dominio = {}
+    for indices in intercambiables:
+        for k, i in enumerate(indices):
+            dominio[i] = (k, num_slots - len(indices) + k)
+    
+    model = cp_model.CpModel()
+    
+    # Variables: para cada unidad, en qué slot va.
+    # Cursos del mismo bloque comparten la variable de su raíz (mismo día y periodo)
+    asignacion = {}
+    for i in range(num_unidades):
+        if raiz[i] == i:
+            minimo, maximo = dominio.get(i, (0, num_slots - 1))
+            asignacion[i] = model.NewIntVar(minimo, maximo, f'unidad_{i}')
         else:
-            mensaje = analizar_infactibilidad(unidades, periodos_validos, grados, bloques_equiv, mismo_bloque)
-            return {
-                'exito': False,
-                'asignaciones': {},
-                'mensaje': mensaje,
-                'status': 'INFEASIBLE',
-                'modo': 'unidia'
-            }
-
-def analizar_infactibilidad(unidades, periodos_validos, grados, bloques_equiv, mismo_bloque):
-    """Analiza por qué no hay solución (modo un día)"""
-    num_periodos = len(periodos_validos)
+            asignacion[i] = asignacion[raiz[i]]
     
-    cursos_por_docente = {}
-    unidades_contadas = set()
+    # Restricción: Un docente no puede estar en dos lugares al mismo tiempo
+    # EXCEPTO si son del mismo bloque de equivalencia (ya coalescidos en su raíz).
+    # Restricción: Un grado no puede tener dos cursos al mismo tiempo.
+    # El slot determina día y periodo, así que basta con que los slots sean distintos
+    for grupo in grupos_distintos:
+        model.AddAllDifferent([asignacion[i] for i in grupo])
     
-    for bloque_id, indices in bloques_equiv.items():
-        if indices:
-            idx = indices[0]
-            u = unidades[idx]
-            doc = u['id_docente']
-            nombre = u.get('docente_nombre', f'Docente {doc}')
-            if doc not in cursos_por_docente:
-                cursos_por_docente[doc] = {'nombre': nombre, 'count': 0}
-            cursos_por_docente[doc]['count'] += 1
-            for i in indices:
-                unidades_contadas.add(i)
+    # Ruptura de simetría: ordenar los slots dentro de cada grupo intercambiable
+    # (estricto porque el mismo docente ya no puede repetir slot)
+    for indices in intercambiables:
+        for a, b in zip(indices, indices[1:]):
+            model.Add(asignacion[a] < asignacion[b])
     
-    for i, u in enumerate(unidades):
-        if i in unidades_contadas:
-            continue
-        doc = u['id_docente']
-        nombre = u.get('docente_nombre', f'Docente {doc}')
-        if doc not in cursos_por_docente:
-            cursos_por_docente[doc] = {'nombre': nombre, 'count': 0}
-        cursos_por_docente[doc]['count'] += 1
+    # Hint: partir de una solución previa acelera requests casi idénticos.
+    # Solo se sugiere un valor por variable (la raíz de cada bloque)
+    if hint_slots is None and hint:
+        hint_slots = _slots_de_hint(hint, modo_multidia, dias, periodos_validos, periodos_por_dia)
+    for i, slot in enumerate((hint_slots or [])[:num_unidades]):
+        if raiz[i] == i and isinstance(slot, int) and 0 <= slot < num_slots:
+            model.AddHint(asignacion[i], slot)
     
-    problemas = []
-    for doc, info in cursos_por_docente.items():
-        if info['count'] > num_periodos:
-            exceso = info['count'] - num_periodos
-            problemas.append(f"{info['nombre']}: {info['count']} cursos (excede por {exceso})")
+    # Resolver
+    solver = crear_solver(max_tiempo, num_hilos)
     
-    if problemas:
-        return "No hay solucion sin cruces. Docentes con exceso:\n" + "\n".join(problemas)
-    else:
-        return "Restricciones demasiado estrictas para encontrar solucion."
-
-def analizar_infactibilidad_multidia(unidades, periodos_por_dia, num_dias, grados, bloques_equiv, mismo_bloque):
-    """Analiza por qué no hay solución (modo multidía)"""
-    max_periodos = periodos_por_dia * num_dias
+    status = solver.Solve(model)
     
-    cursos_por_docente = {}
-    unidades_contadas = set()
+    if status != cp_model.OPTIMAL and status != cp_model.FEASIBLE:
+        return {
+            'exito': False,
+            'asignaciones': [],
+            'mensaje': _analizar(nombre_docente, por_docente, num_slots, encabezado),
+            'status': 'INFEASIBLE',
+            'modo': modo
+        }, None
     
-    for bloque_id, indices in bloques_equiv.items():
-        if indices:
-            idx = indices[0]
-            u = unidades[idx]
-            doc = u['id_docente']
-            nombre = u.get('docente_nombre', f'Docente {doc}')
-            if doc not in cursos_por_docente:
-                cursos_por_docente[doc] = {'nombre': nombre, 'count': 0}
-            cursos_por_docente[doc]['count'] += 1
-            for i in indices:
-                unidades_contadas.add(i)
+    slots = [solver.Value(asignacion[i]) for i in range(num_unidades)]
     
-    for i, u in enumerate(unidades):
-        if i in unidades_contadas:
-            continue
-        doc = u['id_docente']
-        nombre = u.get('docente_nombre', f'Docente {doc}')
-        if doc not in cursos_por_docente:
-            cursos_por_docente[doc] = {'nombre': nombre, 'count': 0}
-        cursos_por_docente[doc]['count'] += 1
+    if modo_multidia:
+        # [dia, periodo] por posición de unidad: sin claves repetidas en la respuesta
+        resultado = []
+        for slot in slots:
+            dia_idx = slot // periodos_por_dia
+            periodo_idx = slot % periodos_por_dia
+            resultado.append([
+                dias[dia_idx] if dia_idx < len(dias) else f'DIA_{dia_idx}',
+                periodos_validos[periodo_idx] if periodo_idx < len(periodos_validos) else periodo_idx
+            ])
+    else:
+        # Periodo por posición de unidad
+        resultado = [periodos_validos[slot] for slot in slots]
     
+    return {
+        'exito': True,
+        'asignaciones': resultado,
+        'mensaje': 'Solucion encontrada sin cruces',
+        'status': 'OPTIMAL' if status == cp_model.OPTIMAL else 'FEASIBLE',
+        'modo': modo
+    }, slots
+
+def _slots_de_hint(hint, modo_multidia, dias, periodos_validos, periodos_por_dia):
+    """Convierte asignaciones previas a slots (None donde no aplica). Si los periodos o
+    días no son hasheables (p. ej. objetos) no se pueden mapear y no hay hint"""
+    try:
+        periodo_idx = {p: k for k, p in enumerate(periodos_validos)}
+        dia_idx = {d: k for k, d in enumerate(dias)}
+    except TypeError:
+        return []
+    return [_slot_de_hint(valor, modo_multidia, dia_idx, periodo_idx, periodos_por_dia) for valor in hint]
+
+def _slot_de_hint(valor, modo_multidia, dia_idx, periodo_idx, periodos_por_dia):
+    """Convierte una entrada de asignaciones (periodo o [dia, periodo]) a su slot; None si no aplica"""
+    try:
+        if not modo_multidia:
+            return periodo_idx.get(valor)
+        d, p = dia_idx.get(valor[0]), periodo_idx.get(valor[1])
+    except (TypeError, IndexError, KeyError):
+        return None
+    if d is None or p is None or p >= periodos_por_dia:
+        return None
+    return d * periodos_por_dia + p
+
+def _analizar(nombre_docente, por_docente, slots_disponibles, label):
+    """Analiza por qué no hay solución: docentes con más cursos que slots disponibles.
+    por_docente ya cuenta cada bloque una sola vez, así que basta con su tamaño"""
     problemas = []
-    for doc, info in cursos_por_docente.items():
-        if info['count'] > max_periodos:
-            exceso = info['count'] - max_periodos
-            problemas.append(f"{info['nombre']}: {info['count']} cursos (excede {max_periodos} slots por {exceso})")
+    for doc, indices in por_docente.items():
+        if len(indices) > slots_disponibles:
+            nombre = nombre_docente[doc]
+            exceso = len(indices) - slots_disponibles
+            problemas.append(f"{nombre}: {len(indices)} cursos (excede por {exceso})")
     
     if problemas:
-        return f"No hay solucion sin cruces ({num_dias} dias x {periodos_por_dia} periodos = {max_periodos} slots). Docentes:\n" + "\n".join(problemas)
+        return label + "\n" + "\n".join(problemas)
     else:
         return "Restricciones demasiado estrictas para encontrar solucion."
 
 def main():
     try:
-        input_data = sys.stdin.read()
-        datos = json.loads(input_data)
+        datos = orjson.loads(sys.stdin.buffer.read())
         resultado = resolver_horario(datos)
-        print(json.dumps(resultado, ensure_ascii=False))
+        sys.stdout.buffer.write(orjson.dumps(resultado))
     except Exception as e:
         error = {
             'exito': False,
-            'asignaciones': {},
+            'asignaciones': [],
             'mensaje': f'Error en solver: {str(e)}',
             'status': 'ERROR'
         }
-        print(json.dumps(error, ensure_ascii=False))
+        sys.stdout.buffer.write(orjson.dumps(error))
         sys.exit(1)
 
 if __name__ == '__main__':